@@ -1,64 +1,300 @@
 import streamlit as st
+import streamlit.components.v1 as components
+import os
+import base64
+import importlib.util
+import atexit
+import threading
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import pytz
-from PIL import Image
-import io
 import numpy as np
 
 # Handle optional imports gracefully
-try:
-    import gspread
-    from oauth2client.service_account import ServiceAccountCredentials
-    GSPREAD_AVAILABLE = True
-except ImportError:
+# gspread and OpenCV are only located here; they are imported by the functions that use them
+GSPREAD_AVAILABLE = all(importlib.util.find_spec(name) for name in ("gspread", "oauth2client"))
+if not GSPREAD_AVAILABLE:
     st.error("❌ Google Sheets integration not available. Please install: pip install gspread oauth2client")
-    GSPREAD_AVAILABLE = False
+
+CV2_AVAILABLE = importlib.util.find_spec("cv2") is not None
+if not CV2_AVAILABLE:
+    st.warning("⚠️ OpenCV not available. QR detection may be limited. Install with: pip install opencv-python-headless")
+
+@st.cache_resource
+def cv2_available():
+    """Whether OpenCV actually imports; a broken install (e.g. missing libGL) counts as missing"""
+    if not CV2_AVAILABLE:
+        return False
+    try:
+        import cv2
+    except ImportError:
+        return False
+    return True
 
 try:
-    import cv2
-    CV2_AVAILABLE = True
+    from camera_input_live import camera_input_live
+    CAMERA_LIVE_AVAILABLE = True
 except ImportError:
-    st.warning("⚠️ OpenCV not available. QR detection may be limited. Install with: pip install opencv-python-headless")
-    CV2_AVAILABLE = False
+    CAMERA_LIVE_AVAILABLE = False
 
 # ========================
 # QR CODE DETECTION FUNCTIONS  
 # ========================
 
-def detect_qr_with_opencv(image):
-    """Try to detect QR code using OpenCV"""
-    if not CV2_AVAILABLE:
-        st.error("OpenCV not available for QR detection")
-        return None
-        
+# Longest image side (px) passed to the QR detector
+MAX_DETECT_SIZE = 800
+
+# Minimum seconds between detection attempts on the live camera feed
+LIVE_SCAN_INTERVAL = 0.5
+# Minimum seconds between two browser frames decoded on the server
+MIN_CAPTURE_INTERVAL = 0.3
+
+@st.cache_resource
+def get_qr_detector():
+    """Create the QR detector once and reuse it for every scan; returns (detector, lock)"""
+    # Sessions run on separate threads and the detector keeps internal scratch buffers,
+    # so calls are serialised
+    import cv2
+    
+    # The ArUco-based detector (OpenCV 4.8+) is faster and more robust than the legacy one
+    if hasattr(cv2, "QRCodeDetectorAruco"):
+        return cv2.QRCodeDetectorAruco(), threading.Lock()
+    return cv2.QRCodeDetector(), threading.Lock()
+
+@st.cache_resource
+def get_zbar_decoder():
+    """Load pyzbar and its QR-only symbol set once; None if pyzbar or libzbar is missing"""
     try:
-        # Convert PIL image to OpenCV format
-        img_array = np.array(image)
-        
-        # Initialize QR code detector
-        qr_detector = cv2.QRCodeDetector()
-        
-        # Detect and decode QR code
-        data, vertices_array, binary_qrcode = qr_detector.detectAndDecode(img_array)
-        
+        from pyzbar.pyzbar import decode, ZBarSymbol
+    except ImportError:
+        return None
+    return decode, [ZBarSymbol.QRCODE]
+
+def _decode_with_detector(qr_detector, img_array, small, scale):
+    """Locate QR codes on the downscaled image and decode them from the full-resolution one"""
+    import cv2
+    
+    # Cheap localisation first (all codes in one pass); only decode when something was found
+    found, points = qr_detector.detectMulti(small)
+    if not found:
+        return []
+    
+    if small is img_array:
+        ok, decoded_info, straight_qrcodes = qr_detector.decodeMulti(img_array, points)
+        return [data for data in decoded_info if data] if ok else []
+    
+    # Decode each located region, cropped from the full-resolution image:
+    # full detail per module without a full-size decode pass per code
+    codes = []
+    for quad in np.asarray(points, dtype=np.float32).reshape(-1, 4, 2) / scale:
+        x, y, roi_w, roi_h = cv2.boundingRect(quad.astype(np.int32))
+        pad = max(roi_w, roi_h) // 10
+        x0, y0 = max(x - pad, 0), max(y - pad, 0)
+        roi = img_array[y0:y + roi_h + pad, x0:x + roi_w + pad]
+        roi_points = (quad - (x0, y0)).astype(np.float32).reshape(1, -1, 2)
+        data, binary_qrcode = qr_detector.decode(roi, roi_points)
         if data:
-            return data
+            codes.append(data)
+    return codes
+
+def _get_decoders():
+    """Fetch the cached zbar decoder and OpenCV detector, on the script thread"""
+    return get_zbar_decoder(), get_qr_detector()
+
+def _decode_gray(img_array, small, scale, decoders):
+    """Decode every QR code in a grayscale image with zbar, then with the OpenCV detector"""
+    zbar, (qr_detector, detector_lock) = decoders
+    # zbar is typically faster and more reliable on single, noisy phone captures
+    if zbar:
+        decode, symbols = zbar
+        results = decode(small, symbols=symbols)
+        if results:
+            return list(dict.fromkeys(r.data.decode("utf-8") for r in results))
+    
+    with detector_lock:
+        return list(dict.fromkeys(_decode_with_detector(qr_detector, img_array, small, scale)))
+
+def _preprocessing_variants(gray):
+    """Yield enhanced versions of a grayscale image, cheapest first, for hard-to-read codes"""
+    import cv2
+    
+    yield cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    for clip_limit in (2.0, 4.0):
+        yield cv2.createCLAHE(clipLimit=clip_limit).apply(gray)
+    yield 255 - gray  # Light-on-dark codes
+    yield cv2.morphologyEx(gray, cv2.MORPH_CLOSE, np.ones((3, 3), np.uint8))
+    if max(gray.shape[:2]) < MAX_DETECT_SIZE:
+        # Small images / codes: give the decoder more pixels per module
+        yield cv2.resize(gray, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+
+def _detect_qr_codes(image, decoders, thorough=False):
+    """Detect all QR codes in image bytes, a file object or a numpy array; raises on errors"""
+    import cv2
+    
+    if isinstance(image, np.ndarray):
+        img_array = image
+        if img_array.ndim == 3:
+            # Decoded colour frames (OpenCV BGR order) -> one vectorised gray pass
+            code = cv2.COLOR_BGRA2GRAY if img_array.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+            img_array = cv2.cvtColor(img_array, code)
+    else:
+        # Decode the encoded image straight to grayscale (no PIL decode + array copy)
+        bytes_data = image if isinstance(image, bytes) else image.getvalue()
+        img_array = cv2.imdecode(np.frombuffer(bytes_data, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if img_array is None:
+            return []
+    
+    # Downscale large captures; QR codes decode fine well below camera resolution
+    small = img_array
+    scale = 1.0
+    h, w = img_array.shape[:2]
+    if max(h, w) > MAX_DETECT_SIZE:
+        scale = MAX_DETECT_SIZE / max(h, w)
+        small = cv2.resize(img_array, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    
+    codes = _decode_gray(img_array, small, scale, decoders)
+    if codes or not thorough:
+        return codes
+    
+    # Small or distant codes can vanish in the downscale: retry at native resolution
+    if scale < 1:
+        codes = _decode_gray(img_array, img_array, 1.0, decoders)
+        if codes:
+            return codes
+    
+    # Single captures (thorough=True) are worth a few enhancement passes before asking
+    # for a retake; live frames skip this since the next frame is a retry anyway
+    for variant in _preprocessing_variants(small):
+        codes = _decode_gray(variant, variant, 1.0, decoders)
+        if codes:
+            return codes
+    return []
+
+def detect_qr_with_opencv(image, thorough=False):
+    """Detect QR codes in an image, reporting failures in the page"""
+    if not cv2_available():
+        st.error("OpenCV not available for QR detection")
+        return []
+    
+    try:
+        return _detect_qr_codes(image, _get_decoders(), thorough)
+    except Exception as e:
+        st.error(f"OpenCV detection error: {e}")
+        return []
+
+@st.cache_resource
+def get_decode_pool():
+    """Shared worker pool so slow decodes don't block the script thread"""
+    return ThreadPoolExecutor(max_workers=2)
+
+def detect_qr_in_background(image_bytes, key):
+    """Decode a capture on the worker pool; returns its QR values, or None while still decoding"""
+    if not cv2_available():
+        st.error("OpenCV not available for QR detection")
+        return []
+    
+    # One job per key, resubmitted only when the image changes: reruns poll instead of re-decoding
+    jobs = st.session_state.setdefault("decode_jobs", {})
+    digest = hash(image_bytes)
+    job = jobs.get(key)
+    if job is None or job[0] != digest:
+        # Decoders are resolved here; the worker raises instead of calling st.error
+        job = (digest, get_decode_pool().submit(_detect_qr_codes, image_bytes, _get_decoders(), True))
+        jobs[key] = job
+    
+    future = job[1]
+    if not future.done():
         return None
+    try:
+        return future.result()
     except Exception as e:
         st.error(f"OpenCV detection error: {e}")
+        return []
+
+def decode_pending():
+    """Whether any capture of this session is still being decoded"""
+    return any(not future.done() for _, future in st.session_state.get("decode_jobs", {}).values())
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def preview_data_url(image_bytes, width):
+    """Encode a small JPEG thumbnail of an image once, as a data URL for inline preview"""
+    import cv2
+    
+    img_array = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img_array is None:
         return None
+    h, w = img_array.shape[:2]
+    if w > width:
+        img_array = cv2.resize(img_array, (width, round(h * width / w)), interpolation=cv2.INTER_AREA)
+    ok, jpeg = cv2.imencode(".jpg", img_array, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg.tobytes()).decode("ascii") if ok else None
+
+def show_preview(image_bytes, caption, width):
+    """Show a captured image without st.image re-processing it on every rerun"""
+    data_url = preview_data_url(image_bytes, width) if cv2_available() else None
+    if data_url is None:
+        st.image(image_bytes, caption=caption, width=width)
+        return
+    st.markdown(
+        f'<img src="{data_url}" width="{width}"/>'
+        f'<p style="color: #666; font-size: 14px;">{caption}</p>',
+        unsafe_allow_html=True
+    )
+
+# ========================
+# BROWSER QR SCANNER COMPONENT
+# ========================
+
+# Decodes QR codes in the browser (BarcodeDetector / jsQR) and returns only the decoded text
+_qr_scanner_component = components.declare_component(
+    "qr_scanner",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "qr_scanner")
+)
+
+def browser_qr_scanner(key="browser_scanner"):
+    """Render the in-browser scanner and return newly scanned QR values (possibly none)"""
+    result = _qr_scanner_component(key=key, default=None)
+    if not result:
+        return []
+    
+    # The component keeps returning its last value on every rerun; handle each value once
+    last_key = f"{key}_last_value"
+    if st.session_state.get(last_key) == result:
+        return []
+    st.session_state[last_key] = result
+    
+    # Browsers that cannot decode QR codes send raw JPEG frame bytes, decoded here instead
+    if isinstance(result, bytes):
+        # Frames are disposable: drop ones arriving faster than we want to decode them
+        if time.time() - st.session_state.get("last_capture_ts", 0) < MIN_CAPTURE_INTERVAL:
+            return []
+        st.session_state["last_capture_ts"] = time.time()
+        return detect_qr_with_opencv(result)
+    return [result["data"]] if result.get("data") else []
 
 # ========================
 # GOOGLE SHEETS CONNECTION
 # ========================
 
-@st.cache_resource
+# Seconds during which a repeat scan of the same ID is ignored
+DUPLICATE_SCAN_WINDOW = 5
+
+# Balloons on every entry are off by default; set SHOW_ANIMATIONS=1 to enable them
+SHOW_ANIMATIONS = os.environ.get("SHOW_ANIMATIONS", "").lower() in ("1", "true", "yes")
+
+@st.cache_resource(show_spinner=False)
 def init_google_sheets():
     """Initialize Google Sheets connection with caching"""
     if not GSPREAD_AVAILABLE:
         st.error("Google Sheets integration not available. Please install required packages.")
         return None
         
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+    from requests.adapters import HTTPAdapter
+    
     try:
         scope = ["https://spreadsheets.google.com/feeds",
                  "https://www.googleapis.com/auth/drive"]
@@ -72,6 +308,12 @@ def init_google_sheets():
             creds = ServiceAccountCredentials.from_json_keyfile_name("credentials.json", scope)
         
         client = gspread.authorize(creds)
+        
+        # Every sheet call goes through this authorized session; keep its connections
+        # alive (no TLS handshake per call) and retry dropped connections
+        session = client.http_client.session if hasattr(client, "http_client") else client.session
+        session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=3))
+        
         sheet = client.open("orientation_passes").sheet1
         return sheet
     except Exception as e:
@@ -79,6 +321,223 @@ def init_google_sheets():
         st.info("Please check your credentials configuration.")
         return None
 
+def reset_sheets_on_auth_error(error):
+    """Drop the cached Sheets handles if Google rejected our credentials, so the next run re-authorizes"""
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 401:
+        init_google_sheets.clear()
+        init_scan_log.clear()
+
+# Sheet layout: ID | Name | Branch | EntryStatus | EntryTime | ExitStatus | ExitTime
+SHEET_COLUMNS = 7
+
+# Seconds the ID index is reused. Entries made here are tracked locally until synced
+# (and the sync clears the cache), so this only bounds how soon rows added to the
+# roster, or entries synced by another station, become visible.
+SNAPSHOT_TTL = 60
+
+@st.cache_data(ttl=SNAPSHOT_TTL, show_spinner=False)
+def load_sheet_snapshot(_sheet, sheet_id):
+    """Index columns A:G by student ID (one read), cached for SNAPSHOT_TTL per sheet"""
+    return _read_sheet_index(_sheet)
+
+def _read_sheet_index(sheet):
+    """Uncached read behind load_sheet_snapshot, also used by the sync"""
+    # Maps ID -> (row number, name, branch, entry status, entry time, exit status)
+    rows = sheet.get("A2:G")  # Data rows of the ID..ExitTime columns, no header
+    index = {}
+    for i, row in enumerate(rows, start=2):
+        row += [""] * (SHEET_COLUMNS - len(row))
+        index[row[0]] = (i, *row[1:6])
+    return index
+
+# ========================
+# SCAN LOG + SYNC
+# ========================
+
+# Scans are appended to this worksheet (one API call, no read) and copied into the
+# main sheet's EntryStatus/EntryTime columns in batches
+SCAN_LOG_TITLE = "scan_log"
+
+# Log rows are buffered and written with one append_rows once this many are waiting,
+# or once the oldest has waited this many seconds
+LOG_FLUSH_SIZE = 25
+LOG_FLUSH_INTERVAL = 10
+
+# Sync once this many entries are waiting, or once the oldest has waited this many seconds
+SYNC_BATCH_SIZE = 10
+SYNC_INTERVAL = 60
+
+# Seconds between the background writer's checks for due work, and its wait after a failure
+WRITER_POLL_INTERVAL = 1
+WRITER_RETRY_DELAY = 10
+
+@st.cache_resource
+def init_scan_log(_sheet):
+    """Open the append-only scan log worksheet, creating it on first use"""
+    import gspread
+    
+    spreadsheet = _sheet.spreadsheet
+    try:
+        log_sheet = spreadsheet.worksheet(SCAN_LOG_TITLE)
+    except gspread.exceptions.WorksheetNotFound:
+        log_sheet = spreadsheet.add_worksheet(title=SCAN_LOG_TITLE, rows=1000, cols=3)
+        log_sheet.append_row(["Timestamp", "ID", "Event"], value_input_option="RAW")
+    
+    state = get_sync_state()
+    with state["lock"]:
+        if state["log_sheet"] is None:
+            # Best-effort: don't lose buffered rows when the server shuts down. Registered
+            # once; it writes through the latest handle, even after re-authorizing.
+            atexit.register(_flush_at_exit, state)
+        state["log_sheet"] = log_sheet
+    return log_sheet
+
+@st.cache_resource
+def get_sync_state():
+    """Scan-log rows not yet written and entries not yet synced to the main sheet, shared by all sessions"""
+    return {
+        "pending_rows": [],
+        "oldest_row": None,
+        "unsynced": {},
+        "oldest": None,
+        "lock": threading.RLock(),  # Guards the buffers; only held briefly
+        "io_lock": threading.RLock(),  # Serializes Sheets writes, so scans never wait on the network
+        "log_sheet": None,  # Latest scan-log handle, set by init_scan_log
+        "sheet": None,  # Latest main-sheet handle, used by the background writer
+        "wake": threading.Event(),
+        "errors": queue.Queue(),
+    }
+
+def _take_pending_rows(state):
+    """Empty the log buffer and return its rows and age (caller holds state["lock"])"""
+    rows, state["pending_rows"] = state["pending_rows"], []
+    oldest_row, state["oldest_row"] = state["oldest_row"], None
+    return rows, oldest_row
+
+def _write_rows(log_sheet, state, rows, oldest_row):
+    """Append taken rows with one append_rows call, putting them back if it fails"""
+    if not rows:
+        return 0
+    try:
+        log_sheet.append_rows(rows, value_input_option="RAW")
+    except Exception:
+        # Back in front of anything buffered meanwhile
+        with state["lock"]:
+            state["pending_rows"][:0] = rows
+            state["oldest_row"] = oldest_row
+        raise
+    return len(rows)
+
+def _append_pending_rows(log_sheet, state):
+    """Write all buffered log rows with a single append_rows call"""
+    with state["io_lock"]:
+        with state["lock"]:
+            rows, oldest_row = _take_pending_rows(state)
+        return _write_rows(log_sheet, state, rows, oldest_row)
+
+def _flush_at_exit(state):
+    """Write whatever is still buffered when the process exits"""
+    _append_pending_rows(state["log_sheet"], state)
+
+def _flush_due(state):
+    """Whether the log buffer is full or its oldest row has waited long enough"""
+    with state["lock"]:
+        return bool(state["pending_rows"]) and (
+            len(state["pending_rows"]) >= LOG_FLUSH_SIZE
+            or time.monotonic() - state["oldest_row"] > LOG_FLUSH_INTERVAL
+        )
+
+def log_entry(student_id, now):
+    """Buffer an entry for the scan log and remember it until the next sync (no API call)"""
+    state = get_sync_state()
+    with state["lock"]:
+        state["pending_rows"].append([now, student_id, "entry"])
+        state["unsynced"][student_id] = now
+        if state["oldest_row"] is None:
+            state["oldest_row"] = time.monotonic()
+        if state["oldest"] is None:
+            state["oldest"] = time.monotonic()
+        if len(state["pending_rows"]) >= LOG_FLUSH_SIZE or len(state["unsynced"]) >= SYNC_BATCH_SIZE:
+            state["wake"].set()  # Don't make a full batch wait for the writer's next poll
+
+def sync_scan_log(sheet, log_sheet, state):
+    """Copy logged entries the main sheet does not show yet into it with one batch_update; returns the row count"""
+    with state["io_lock"]:
+        # The sync reads the log back, so exactly the entries whose rows are written
+        # here may be marked synced: take both in one critical section
+        with state["lock"]:
+            rows, oldest_row = _take_pending_rows(state)
+            pending = dict(state["unsynced"])
+        _write_rows(log_sheet, state, rows, oldest_row)
+        
+        # Work from the whole log, so entries logged before a restart (or by another server) sync too
+        first_entry = {}
+        for row in log_sheet.get("A2:C"):
+            if len(row) == 3 and row[2] == "entry":
+                first_entry.setdefault(row[1], row[0])
+        
+        students = _read_sheet_index(sheet)
+        updates = [
+            {"range": f"D{info[0]}:E{info[0]}", "values": [["Entered", first_entry[student_id]]]}
+            for student_id, info in students.items()
+            if student_id in first_entry and not info[3]
+        ]
+        if updates:
+            sheet.batch_update(updates, value_input_option="USER_ENTERED")
+        load_sheet_snapshot.clear()  # Fresh data was just read; a plain clear needs no script context
+        
+        # Entries logged while this sync ran stay queued for the next one
+        with state["lock"]:
+            for student_id in pending:
+                state["unsynced"].pop(student_id, None)
+            state["oldest"] = time.monotonic() if state["unsynced"] else None
+        return len(updates)
+
+def _sync_due(state):
+    """Whether enough entries are waiting or the oldest one has waited long enough"""
+    with state["lock"]:
+        return bool(state["unsynced"]) and (
+            len(state["unsynced"]) >= SYNC_BATCH_SIZE
+            or time.monotonic() - state["oldest"] > SYNC_INTERVAL
+        )
+
+def _sheet_writer_loop(state):
+    """Flush the scan log and sync entries whenever due, through handles resolved by the script thread"""
+    delay = WRITER_POLL_INTERVAL
+    while True:
+        state["wake"].wait(timeout=delay)
+        state["wake"].clear()
+        sheet, log_sheet = state["sheet"], state["log_sheet"]
+        if sheet is None or log_sheet is None:
+            continue
+        try:
+            if _flush_due(state):
+                _append_pending_rows(log_sheet, state)
+            if _sync_due(state):
+                sync_scan_log(sheet, log_sheet, state)
+            delay = WRITER_POLL_INTERVAL
+        except Exception as e:
+            # Reported by the next rerun; back off rather than hammer a failing API
+            state["errors"].put(e)
+            delay = WRITER_RETRY_DELAY
+
+@st.cache_resource
+def start_sheet_writer():
+    """Start the one background thread doing all scan-log and sync writes (threads can't be cached as data)"""
+    thread = threading.Thread(target=_sheet_writer_loop, args=(get_sync_state(),),
+                              name="sheet-writer", daemon=True)
+    thread.start()
+    return thread
+
+def report_sheet_writer_errors():
+    """Show background write failures on whichever session reruns next"""
+    errors = get_sync_state()["errors"]
+    while not errors.empty():
+        e = errors.get_nowait()
+        reset_sheets_on_auth_error(e)
+        st.toast(f"⚠️ Could not write to the sheet yet: {e}")
+
 def get_ist_time():
     """Get current time in IST"""
     ist = pytz.timezone('Asia/Kolkata')
@@ -91,11 +550,15 @@ def format_ist_datetime():
 def get_entry_statistics(sheet):
     """Get real-time entry statistics"""
     try:
-        records = sheet.get_all_records()
-        total_entries = sum(1 for row in records if row.get("EntryStatus") == "Entered")
-        total_exits = sum(1 for row in records if row.get("ExitStatus") == "Exited")
+        snapshot = load_sheet_snapshot(sheet, sheet.id)
+        students = snapshot.values()
+        # Entries logged but not synced yet are not in the sheet snapshot
+        unsynced = sum(1 for student_id in list(get_sync_state()["unsynced"])
+                       if student_id in snapshot and not snapshot[student_id][3])
+        total_entries = sum(1 for info in students if info[3] == "Entered") + unsynced
+        total_exits = sum(1 for info in students if info[5] == "Exited")
         currently_present = total_entries - total_exits
-        total_students = len(records)
+        total_students = len(students)
         
         return {
             "total_entries": total_entries,
@@ -113,55 +576,170 @@ def get_entry_statistics(sheet):
 
 def process_student_entry(qr_data, sheet):
     """Process the scanned student data for ENTRY ONLY"""
+    # The same code is usually decoded on several consecutive frames; handle it once.
+    # Tracked per ID so two students alternating in front of the camera are both throttled.
+    last_scans = st.session_state.setdefault("last_scans", {})
+    now_ts = time.monotonic()
+    if now_ts - last_scans.get(str(qr_data), float("-inf")) < DUPLICATE_SCAN_WINDOW:
+        st.info(f"🔁 **{qr_data}** was just scanned. Please wait a moment before scanning again.")
+        return
+    last_scans[str(qr_data)] = now_ts
+    
+    # IDs this session already checked in (or found checked in): nothing left to do
+    seen_ids = st.session_state.setdefault("seen_ids", set())
+    if str(qr_data) in seen_ids:
+        st.info(f"✅ **{qr_data}** is already checked in.")
+        return
+    
     try:
-        records = sheet.get_all_records()
-        found = False
-        
-        for i, row in enumerate(records, start=2):
-            if str(row["ID"]) == str(qr_data):
-                found = True
-                now = format_ist_datetime()  # Use IST time
-                
-                # Check current entry status
-                entry_status = row.get("EntryStatus", "")
-                
-                # Only handle entry - no exit functionality
-                if not entry_status or entry_status == "":
-                    sheet.update_cell(i, 4, "Entered")  # EntryStatus column
-                    sheet.update_cell(i, 5, now)        # EntryTime column
-                    st.success(f"🎉 **WELCOME TO NRCM!**")
-                    st.success(f"✅ **Entry recorded** for **{row['Name']}**")
-                    st.info(f"📚 **Branch:** {row['Branch']}")
-                    st.info(f"🕐 **Entry Time:** {now}")
-                    st.balloons()
-                    
-                    # Show welcome message
-                    st.markdown("""
-                    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                                color: white; padding: 20px; border-radius: 15px; 
-                                text-align: center; margin: 20px 0;">
-                        <h3>🎓 Welcome to Orientation Day!</h3>
-                        <p>Your entry has been successfully recorded.</p>
-                        <p><strong>Next:</strong> Proceed to the orientation hall</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                # Already entered
-                else:
-                    st.warning(f"⚠️ **{row['Name']}** has already checked in!")
-                    st.info(f"📅 **Previous Entry Time:** {row.get('EntryTime', 'Not recorded')}")
-                    st.info("✅ You're all set! Proceed to the orientation activities.")
-                
-                break
+        student_id = str(qr_data)
+        info = load_sheet_snapshot(sheet, sheet.id).get(student_id)
         
-        if not found:
+        if info is None:
             st.error("❌ **Student ID not found** in orientation records.")
             st.write("Please verify your QR code or contact the registration desk.")
+            return
+        
+        _, name, branch, entry_status, entry_time, _ = info
+        state = get_sync_state()
+        with state["lock"]:  # The writer thread pops synced IDs concurrently
+            logged_at = state["unsynced"].get(student_id)
+        if not entry_status and logged_at:
+            entry_status, entry_time = "Entered", logged_at
+        
+        # Already entered: answered from memory, no Sheets call
+        if entry_status:
+            seen_ids.add(student_id)
+            st.warning(f"⚠️ **{name}** has already checked in!")
+            st.info(f"📅 **Previous Entry Time:** {entry_time or 'Not recorded'}")
+            st.info("✅ You're all set! Proceed to the orientation activities.")
+            return
+        
+        # Only handle entry - no exit functionality
+        # Make sure the entry can be written before telling the student it was recorded;
+        # raises (-> Database Error below) if the scan log can't be opened or created
+        init_scan_log(sheet)
+        now = format_ist_datetime()  # Use IST time
+        # Buffered for the scan log; rows are appended and synced to the main sheet in batches
+        log_entry(student_id, now)
+        seen_ids.add(student_id)
+        st.success(f"🎉 **WELCOME TO NRCM!**")
+        st.success(f"✅ **Entry recorded** for **{name}**")
+        st.info(f"📚 **Branch:** {branch}")
+        st.info(f"🕐 **Entry Time:** {now}")
+        st.toast(f"✅ Entry: {name}")
+        if SHOW_ANIMATIONS:
+            st.balloons()
+        
+        # Show welcome message
+        st.markdown(_WELCOME_HTML, unsafe_allow_html=True)
             
     except Exception as e:
+        reset_sheets_on_auth_error(e)
         st.error(f"**Database Error:** {e}")
         st.write("Please try again or contact technical support.")
 
+# ========================
+# STATIC PAGE CONTENT
+# ========================
+
+# Built once at import instead of on every rerun of main()
+_CSS = """
+<style>
+.main-header {
+    text-align: center;
+    color: #4CAF50;
+    font-size: 3rem;
+    margin-bottom: 0.5rem;
+    font-weight: bold;
+}
+.college-header {
+    text-align: center;
+    color: #2196F3;
+    font-size: 1.5rem;
+    margin-bottom: 1rem;
+    font-style: italic;
+}
+.entry-banner {
+    background: linear-gradient(135deg, #4CAF50 0%, #45a049 100%);
+    color: white;
+    padding: 25px;
+    border-radius: 15px;
+    text-align: center;
+    margin: 20px 0;
+    box-shadow: 0 4px 15px rgba(0,0,0,0.2);
+}
+.instruction-box {
+    background-color: #e8f5e8;
+    padding: 1rem;
+    border-radius: 0.5rem;
+    border-left: 4px solid #4CAF50;
+    margin: 1rem 0;
+}
+</style>
+"""
+
+_HEADER_HTML = """
+<h1 class="main-header">🚪 ENTRY SCANNER</h1>
+<h2 class="college-header">Narsimha Reddy Engineering College</h2>
+"""
+
+_BANNER_HTML = """
+<div class="entry-banner">
+    <h2>🎓 ORIENTATION DAY CHECK-IN</h2>
+    <h3>📅 August 18th, 2025</h3>
+    <p><strong>Welcome Students!</strong> Scan your QR code to check-in for orientation.</p>
+    <p>🚪 <strong>This station is for ENTRY ONLY</strong></p>
+</div>
+"""
+
+_INSTRUCTIONS_HTML = """
+<div class="instruction-box">
+📌 <strong>Entry Instructions:</strong><br>
+1. <strong>Scan your student QR code</strong> to check-in<br>
+2. Wait for confirmation message<br>
+3. Proceed to the orientation hall<br>
+4. Keep your student ID ready for verification<br>
+5. For exit, use the <strong>EXIT SCANNER</strong> at the other station
+</div>
+"""
+
+_WELCOME_HTML = """
+<div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
+            color: white; padding: 20px; border-radius: 15px; 
+            text-align: center; margin: 20px 0;">
+    <h3>🎓 Welcome to Orientation Day!</h3>
+    <p>Your entry has been successfully recorded.</p>
+    <p><strong>Next:</strong> Proceed to the orientation hall</p>
+</div>
+"""
+
+# Everything above the tabs, sent as a single markdown element per rerun
+_PAGE_TOP_HTML = _CSS + _HEADER_HTML + _BANNER_HTML + _INSTRUCTIONS_HTML
+
+_MANUAL_ENTRY_GUIDELINES = """
+**✅ When to use Manual Entry:**
+• Camera not working
+• QR code damaged/unreadable
+• Student forgot QR code
+• Technical issues
+"""
+
+_STATION_NOTICE = """
+**🔄 Important:** This is the **ENTRY ONLY** station. 
+For exit or food tracking, please use the **EXIT/FOOD SCANNER** at the designated station.
+"""
+
+_FOOTER_HTML = """
+<div style="text-align: center; color: #666; padding: 20px; background-color: #f8f9fa; border-radius: 10px;">
+    <h4>🚪 Entry Scanner Station</h4>
+    <p><strong>NRCM Orientation Day - August 18th, 2025</strong></p>
+    <p style="font-size: 12px; margin-top: 15px;">
+        © 2025 NRCM - Entry Management System
+    </p>
+</div>
+"""
+
 # ========================
 # STREAMLIT UI
 # ========================
@@ -173,66 +751,8 @@ def main():
         layout="wide"
     )
     
-    # Custom CSS for better styling
-    st.markdown("""
-    <style>
-    .main-header {
-        text-align: center;
-        color: #4CAF50;
-        font-size: 3rem;
-        margin-bottom: 0.5rem;
-        font-weight: bold;
-    }
-    .college-header {
-        text-align: center;
-        color: #2196F3;
-        font-size: 1.5rem;
-        margin-bottom: 1rem;
-        font-style: italic;
-    }
-    .entry-banner {
-        background: linear-gradient(135deg, #4CAF50 0%, #45a049 100%);
-        color: white;
-        padding: 25px;
-        border-radius: 15px;
-        text-align: center;
-        margin: 20px 0;
-        box-shadow: 0 4px 15px rgba(0,0,0,0.2);
-    }
-    .instruction-box {
-        background-color: #e8f5e8;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        border-left: 4px solid #4CAF50;
-        margin: 1rem 0;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-    
-    # Header
-    st.markdown('<h1 class="main-header">🚪 ENTRY SCANNER</h1>', unsafe_allow_html=True)
-    st.markdown('<h2 class="college-header">Narsimha Reddy Engineering College</h2>', unsafe_allow_html=True)
-    
-    # Entry Banner
-    st.markdown("""
-    <div class="entry-banner">
-        <h2>🎓 ORIENTATION DAY CHECK-IN</h2>
-        <h3>📅 August 18th, 2025</h3>
-        <p><strong>Welcome Students!</strong> Scan your QR code to check-in for orientation.</p>
-        <p>🚪 <strong>This station is for ENTRY ONLY</strong></p>
-    </div>
-    """, unsafe_allow_html=True)
-    
-    st.markdown("""
-    <div class="instruction-box">
-    📌 <strong>Entry Instructions:</strong><br>
-    1. <strong>Scan your student QR code</strong> to check-in<br>
-    2. Wait for confirmation message<br>
-    3. Proceed to the orientation hall<br>
-    4. Keep your student ID ready for verification<br>
-    5. For exit, use the <strong>EXIT SCANNER</strong> at the other station
-    </div>
-    """, unsafe_allow_html=True)
+    # Custom CSS, header, entry banner and instructions as one element
+    st.markdown(_PAGE_TOP_HTML, unsafe_allow_html=True)
     
     # Initialize Google Sheets
     if not GSPREAD_AVAILABLE:
@@ -244,6 +764,8 @@ def main():
     sheet = init_google_sheets()
     if not sheet:
         st.stop()
+    # The background writer needs the handle before any entry can be buffered
+    get_sync_state()["sheet"] = sheet
     
     # Create tabs for different input methods
     tab1, tab2 = st.tabs(["📱 QR Camera Scanner", "📝 Manual Entry"])
@@ -254,23 +776,51 @@ def main():
         col1, col2 = st.columns([3, 2])
         
         with col1:
-            # Primary Camera Scanner
-            st.write("#### 📷 Scan Student QR Code")
-            camera_image = st.camera_input(
-                "Point camera at student's QR code and take photo",
-                help="For best results: ensure good lighting, hold steady, QR code fills frame"
-            )
+            # Primary scanner: decoding happens in the browser, only the ID is sent back
+            st.write("#### ⚡ Live QR Scanner")
+            for browser_qr in browser_qr_scanner():
+                st.success(f"📋 **Scanned Student ID:** {browser_qr}")
+                process_student_entry(browser_qr, sheet)
             
-            if camera_image:
-                img = Image.open(camera_image)
-                st.image(img, caption="📸 Captured QR Code", width=400)
-                
-                with st.spinner("🔍 Processing entry..."):
-                    qr_data = detect_qr_with_opencv(img)
+            # Server-side camera scanner (used when the browser cannot decode QR codes)
+            st.write("#### 📷 Photo Capture")
+            # Opt-in: a second camera widget would otherwise start another video stream for everyone
+            camera_image = None
+            if st.checkbox("Enable photo capture camera", key="enable_photo_camera",
+                           help="Use this if the live scanner above cannot read codes on this device"):
+                if CAMERA_LIVE_AVAILABLE:
+                    # Continuous feed: frames arrive without pressing the shutter
+                    camera_image = camera_input_live(debounce=500, key="live_camera")
+                else:
+                    camera_image = st.camera_input(
+                        "Point camera at student's QR code and take photo",
+                        help="For best results: ensure good lighting, hold steady, QR code fills frame"
+                    )
+            
+            if camera_image and CAMERA_LIVE_AVAILABLE:
+                # Only run detection every LIVE_SCAN_INTERVAL seconds; skip frames in between
+                qr_codes = []
+                if time.time() - st.session_state.get("last_scan", 0) > LIVE_SCAN_INTERVAL:
+                    st.session_state["last_scan"] = time.time()
+                    qr_codes = detect_qr_with_opencv(camera_image.getvalue())
                 
-                if qr_data:
+                for qr_data in qr_codes:
                     st.success(f"📋 **Scanned Student ID:** {qr_data}")
                     process_student_entry(qr_data, sheet)
+                if not qr_codes:
+                    st.caption("🔍 Scanning... hold the QR code steady in front of the camera")
+            
+            elif camera_image:
+                image_bytes = camera_image.getvalue()
+                show_preview(image_bytes, "📸 Captured QR Code", 400)
+                
+                qr_codes = detect_qr_in_background(image_bytes, "photo_capture")
+                if qr_codes is None:
+                    st.info("🔍 Processing entry...")
+                elif qr_codes:
+                    for qr_data in qr_codes:
+                        st.success(f"📋 **Scanned Student ID:** {qr_data}")
+                        process_student_entry(qr_data, sheet)
                 else:
                     st.error("⚠️ **No QR code detected** in the image.")
                     st.write("**Try again with:**")
@@ -295,15 +845,16 @@ def main():
             )
             
             if uploaded_file:
-                img = Image.open(uploaded_file)
-                st.image(img, caption="Uploaded QR Code", width=300)
-                
-                with st.spinner("🔍 Processing entry..."):
-                    qr_data = detect_qr_with_opencv(img)
+                image_bytes = uploaded_file.getvalue()
+                show_preview(image_bytes, "Uploaded QR Code", 300)
                 
-                if qr_data:
-                    st.success(f"📋 **Scanned ID:** {qr_data}")
-                    process_student_entry(qr_data, sheet)
+                qr_codes = detect_qr_in_background(image_bytes, "upload")
+                if qr_codes is None:
+                    st.info("🔍 Processing entry...")
+                elif qr_codes:
+                    for qr_data in qr_codes:
+                        st.success(f"📋 **Scanned ID:** {qr_data}")
+                        process_student_entry(qr_data, sheet)
                 else:
                     st.error("⚠️ No QR code detected in uploaded image.")
 
@@ -329,18 +880,35 @@ def main():
         
         with col2:
             st.write("#### 📊 Entry Guidelines")
-            st.success("""
-            **✅ When to use Manual Entry:**
-            • Camera not working
-            • QR code damaged/unreadable
-            • Student forgot QR code
-            • Technical issues
-            """)
+            st.success(_MANUAL_ENTRY_GUIDELINES)
     
     # Entry Statistics
     st.write("---")
     st.write("#### 📈 Today's Entry Stats")
     
+    # Buffered log rows and syncs are written by a background thread; show its failures here
+    # Handles are resolved on the script thread and handed over (also after
+    # re-authorizing); the thread never runs cached functions itself
+    try:
+        init_scan_log(sheet)
+    except Exception as e:
+        reset_sheets_on_auth_error(e)
+        st.warning(f"⚠️ Could not open the scan log yet: {e}")
+    start_sheet_writer()
+    report_sheet_writer_errors()
+    
+    with st.sidebar:
+        st.write("#### 🧾 Pending Sheet Writes")
+        waiting = len(get_sync_state()["unsynced"])
+        st.caption(f"⏳ {waiting} entries waiting to be written to the sheet")
+        if st.button("🧾 Submit batch now", disabled=not waiting, use_container_width=True):
+            try:
+                synced = sync_scan_log(sheet, init_scan_log(sheet), get_sync_state())
+                st.success(f"✅ Synced {synced} entries to the sheet")
+            except Exception as e:
+                reset_sheets_on_auth_error(e)
+                st.error(f"Sync failed: {e}")
+    
     # Get real-time statistics
     stats = get_entry_statistics(sheet)
     
@@ -365,21 +933,15 @@ def main():
     
     # Important Notice
     st.markdown("---")
-    st.error("""
-    **🔄 Important:** This is the **ENTRY ONLY** station. 
-    For exit or food tracking, please use the **EXIT/FOOD SCANNER** at the designated station.
-    """)
+    st.error(_STATION_NOTICE)
     
     # Footer
-    st.markdown("""
-    <div style="text-align: center; color: #666; padding: 20px; background-color: #f8f9fa; border-radius: 10px;">
-        <h4>🚪 Entry Scanner Station</h4>
-        <p><strong>NRCM Orientation Day - August 18th, 2025</strong></p>
-        <p style="font-size: 12px; margin-top: 15px;">
-            © 2025 NRCM - Entry Management System
-        </p>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(_FOOTER_HTML, unsafe_allow_html=True)
+    
+    # Poll captures still decoding on the worker pool; the page above stays interactive
+    if decode_pending():
+        time.sleep(0.1)
+        st.rerun()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file